@@ -1,9 +1,13 @@
+import asyncio
 import logging
 import json
 import os
+import tempfile
+import threading
+import webbrowser
 from datetime import datetime
 from typing import Annotated, Literal, Any, Dict, cast
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 
 from dotenv import load_dotenv
 from pydantic import Field
@@ -26,7 +30,7 @@ from livekit.plugins.turn_detector.multilingual import MultilingualModel
 logger = logging.getLogger("agent")
 load_dotenv(".env.local")
 
-@dataclass
+@dataclass(slots=True)
 class OrderState:
     drinkType: str | None = None
     size: str | None = None
@@ -35,28 +39,32 @@ class OrderState:
     name: str | None = None
     
     def is_complete(self) -> bool:
-        return all([
-            self.drinkType is not None,
-            self.size is not None,
-            self.milk is not None,
-            self.name is not None
-        ])
-
-@dataclass
+        return (
+            self.drinkType is not None
+            and self.size is not None
+            and self.milk is not None
+            and self.name is not None
+        )
+
+    def summary(self) -> str:
+        extras_text = f" with {', '.join(self.extras)}" if self.extras else ""
+        return f"{self.size} {self.drinkType} with {self.milk} milk{extras_text}"
+
+@dataclass(slots=True)
 class Userdata:
     order: OrderState
     session_start: datetime = field(default_factory=datetime.now)
 
+CUP_HEIGHTS = {"small": "120px", "medium": "150px", "large": "180px", "extra large": "220px"}
+DRINK_COLORS = {
+    "latte": "#D2B48C", "cappuccino": "#8B4513", "americano": "#654321",
+    "espresso": "#2F1B14", "mocha": "#7B3F00", "coffee": "#6F4E37",
+    "cold brew": "#4A4A4A", "matcha": "#7CB342"
+}
+
 def generate_beverage_html(order: OrderState) -> str:
-    size_map = {"small": "120px", "medium": "150px", "large": "180px", "extra large": "220px"}
-    drink_colors = {
-        "latte": "#D2B48C", "cappuccino": "#8B4513", "americano": "#654321",
-        "espresso": "#2F1B14", "mocha": "#7B3F00", "coffee": "#6F4E37",
-        "cold brew": "#4A4A4A", "matcha": "#7CB342"
-    }
-    
-    cup_height = size_map.get(order.size or "medium", "150px")
-    drink_color = drink_colors.get(order.drinkType or "coffee", "#6F4E37")
+    cup_height = CUP_HEIGHTS.get(order.size or "medium", "150px")
+    drink_color = DRINK_COLORS.get(order.drinkType or "coffee", "#6F4E37")
     has_whipped = "whipped cream" in (order.extras or [])
     
     whipped_cream = '<div style="width:80%;height:20px;background:#FFF;border-radius:50px;margin:0 auto -10px;"></div>' if has_whipped else ""
@@ -74,27 +82,45 @@ def generate_beverage_html(order: OrderState) -> str:
 <p>Extras: {', '.join(order.extras) if order.extras else 'None'}</p>
 </div></body></html>'''
 
+ORDERS_FILE = "orders.json"
+# Resolved once at import; the worker runs from the backend directory
+_ORDERS_PATH = os.path.abspath(ORDERS_FILE)
+
+def load_orders() -> list[Dict[str, Any]]:
+    # Re-read on every save: each job runs in its own process, so a cached copy
+    # would overwrite orders written by other workers
+    if not os.path.exists(_ORDERS_PATH):
+        return []
+    with open(_ORDERS_PATH, 'r') as f:
+        return json.load(f)
+
+def write_orders(orders: list[Dict[str, Any]]) -> None:
+    # Write to a temp file and swap it in so a failed or interrupted write never
+    # leaves a truncated orders.json behind
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(_ORDERS_PATH), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(orders, f, indent=2)
+        # mkstemp creates the file as 0600; keep orders.json readable as before
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, _ORDERS_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+# Saves run in worker threads, so serialize the read-modify-write per process
+_orders_lock = threading.Lock()
+
 def save_order_to_json(order: OrderState) -> None:
     try:
-        orders_file = "orders.json"
-        orders: list[Dict[str, Any]] = []
-        
-        if os.path.exists(orders_file):
-            with open(orders_file, 'r') as f:
-                orders = json.load(f)
-        
         order_data: Dict[str, Any] = {
-            "drinkType": order.drinkType,
-            "size": order.size,
-            "milk": order.milk,
-            "extras": order.extras,
-            "name": order.name,
+            **asdict(order),
             "timestamp": datetime.now().isoformat()
         }
-        orders.append(order_data)
-        
-        with open(orders_file, 'w') as f:
-            json.dump(orders, f, indent=2)
+        with _orders_lock:
+            orders = load_orders()
+            orders.append(order_data)
+            write_orders(orders)
             
         # Generate HTML visualization
         html_content = generate_beverage_html(order)
@@ -103,16 +129,25 @@ def save_order_to_json(order: OrderState) -> None:
             f.write(html_content)
             
         # Try to open the HTML file automatically
-        import webbrowser
         try:
             file_path = os.path.abspath(html_filename)
             webbrowser.open(f'file://{file_path}')
         except Exception:
             pass
             
-        logger.info(f"Order and visualization saved for {order.name} at {html_filename}")
+        logger.info("Order and visualization saved for %s at %s", order.name, html_filename)
     except Exception as e:
-        logger.error(f"Failed to save order: {e}")
+        logger.error("Failed to save order: %s", e)
+
+def open_visualization(order: OrderState) -> str:
+    html_content = generate_beverage_html(order)
+    html_filename = f"current_order_{order.name}.html"
+    with open(html_filename, 'w') as f:
+        f.write(html_content)
+    
+    file_path = os.path.abspath(html_filename)
+    webbrowser.open(f'file://{file_path}')
+    return html_filename
 
 @function_tool
 async def set_drink_type(
@@ -188,21 +223,20 @@ async def complete_order(ctx: RunContext[Userdata]) -> str:
         return f"Almost there! Just need: {', '.join(missing)}"
     
     try:
-        save_order_to_json(order)
-        extras_text = f" with {', '.join(order.extras)}" if order.extras else ""
+        # Disk writes and the browser launch would otherwise stall audio processing
+        await asyncio.to_thread(save_order_to_json, order)
         
-        return f"Perfect! Your {order.size} {order.drinkType} with {order.milk} milk{extras_text} is confirmed, {order.name}! We're preparing your drink now - it'll be ready in 3-5 minutes! Check your order visualization file for a visual preview."
+        return f"Perfect! Your {order.summary()} is confirmed, {order.name}! We're preparing your drink now - it'll be ready in 3-5 minutes! Check your order visualization file for a visual preview."
         
     except Exception as e:
-        logger.error(f"Order save failed: {e}")
+        logger.error("Order save failed: %s", e)
         return "Order recorded but there was a small issue. Don't worry, we'll make your drink right away!"
 
 @function_tool
 async def get_order_status(ctx: RunContext[Userdata]) -> str:
     order = ctx.userdata.order
     if order.is_complete():
-        extras_text = f" with {', '.join(order.extras)}" if order.extras else ""
-        return f"Your order is complete! {order.size} {order.drinkType} with {order.milk} milk{extras_text} for {order.name}"
+        return f"Your order is complete! {order.summary()} for {order.name}"
     
     return "Order in progress..."
 
@@ -214,23 +248,12 @@ async def show_visualization(ctx: RunContext[Userdata]) -> str:
         return "Please complete your order first before viewing the visualization."
     
     try:
-        html_content = generate_beverage_html(order)
-        html_filename = f"current_order_{order.name}.html"
-        with open(html_filename, 'w') as f:
-            f.write(html_content)
-        
-        import webbrowser
-        file_path = os.path.abspath(html_filename)
-        webbrowser.open(f'file://{file_path}')
-        
+        html_filename = await asyncio.to_thread(open_visualization, order)
         return f"Opening your beverage visualization! Check your browser or look for {html_filename} in the backend folder."
     except Exception as e:
         return f"Sorry, couldn't create visualization: {e}"
 
-class BaristaAgent(Agent):
-    def __init__(self):
-        super().__init__(  # type: ignore
-            instructions="""You are a friendly and professional barista at Dusky Cafe.
+BARISTA_INSTRUCTIONS = """You are a friendly and professional barista at Dusky Cafe.
 
 Your mission is to take coffee orders by collecting:
 - Drink Type: latte, cappuccino, americano, espresso, mocha, coffee, cold brew, matcha
@@ -248,40 +271,64 @@ Process:
 6. Confirm and complete order
 
 Be warm, enthusiastic, and professional. Ask one question at a time and confirm choices as you go.
-Use the function tools to record each piece of information.""",
-            tools=[
-                set_drink_type,
-                set_size,
-                set_milk,
-                set_extras,
-                set_name,
-                complete_order,
-                get_order_status,
-                show_visualization,
-            ],
+Use the function tools to record each piece of information."""
+
+BARISTA_TOOLS = (
+    set_drink_type,
+    set_size,
+    set_milk,
+    set_extras,
+    set_name,
+    complete_order,
+    get_order_status,
+    show_visualization,
+)
+
+class BaristaAgent(Agent):
+    def __init__(self):
+        super().__init__(  # type: ignore
+            instructions=BARISTA_INSTRUCTIONS,
+            tools=list(BARISTA_TOOLS),
         )
 
+_VAD_SINGLETON = None
+_ROOM_INPUT_OPTS = None
+
 def prewarm(proc: JobProcess) -> None:
+    global _VAD_SINGLETON
     try:
-        proc.userdata["vad"] = silero.VAD.load()
-        logger.info("VAD model loaded successfully")
+        # Reuse the loaded model if this process has already been prewarmed
+        if _VAD_SINGLETON is None:
+            _VAD_SINGLETON = silero.VAD.load()
+            logger.info("VAD model loaded successfully")
+        proc.userdata["vad"] = _VAD_SINGLETON
     except Exception as e:
-        logger.error(f"Failed to load VAD model: {e}")
+        logger.error("Failed to load VAD model: %s", e)
         raise RuntimeError(f"VAD model initialization failed: {e}") from e
 
 async def entrypoint(ctx: JobContext) -> None:
+    global _ROOM_INPUT_OPTS
     try:
         ctx.log_context_fields = {"room": ctx.room.name}
 
-        session = AgentSession(  # type: ignore
-            stt=deepgram.STT(model="nova-3"),
-            llm=google.LLM(model="gemini-2.5-flash"),
-            tts=murf.TTS(
-                voice="en-US-matthew", 
+        # Construct the plugins concurrently so first-turn latency is bounded by the slowest one
+        stt, llm, tts, turn_detection = await asyncio.gather(
+            asyncio.to_thread(deepgram.STT, model="nova-3"),
+            asyncio.to_thread(google.LLM, model="gemini-2.5-flash"),
+            asyncio.to_thread(
+                murf.TTS,
+                voice="en-US-matthew",
                 style="Conversation",
-                text_pacing=True
+                text_pacing=True,
             ),
-            turn_detection=MultilingualModel(),
+            asyncio.to_thread(MultilingualModel),
+        )
+
+        session = AgentSession(  # type: ignore
+            stt=stt,
+            llm=llm,
+            tts=tts,
+            turn_detection=turn_detection,
             vad=cast(Any, ctx.proc.userdata.get("vad")),
             preemptive_generation=True,
         )
@@ -293,25 +340,29 @@ async def entrypoint(ctx: JobContext) -> None:
                 metrics.log_metrics(ev.metrics)
                 usage_collector.collect(ev.metrics)
             except Exception as e:
-                logger.error(f"Error processing metrics: {e}")
+                logger.error("Error processing metrics: %s", e)
 
         session.on("metrics_collected")(on_metrics_collected)  # type: ignore
 
         async def log_usage() -> None:
             try:
                 summary = usage_collector.get_summary()
-                logger.info(f"Usage: {summary}")
+                logger.info("Usage: %s", summary)
             except Exception as e:
-                logger.error(f"Error logging usage summary: {e}")
+                logger.error("Error logging usage summary: %s", e)
 
         ctx.add_shutdown_callback(log_usage)
 
+        # The noise cancellation options are plain config, so build them once per process
+        if _ROOM_INPUT_OPTS is None:
+            _ROOM_INPUT_OPTS = RoomInputOptions(
+                noise_cancellation=noise_cancellation.BVC(),
+            )
+
         await session.start(  # type: ignore
             agent=BaristaAgent(),
             room=ctx.room,
-            room_input_options=RoomInputOptions(
-                noise_cancellation=noise_cancellation.BVC(),
-            ),
+            room_input_options=_ROOM_INPUT_OPTS,
         )
         
         # Set userdata after session start
@@ -321,10 +372,9 @@ async def entrypoint(ctx: JobContext) -> None:
         await ctx.connect()
         
         # Wait a moment for connection to stabilize
-        import asyncio
         await asyncio.sleep(0.5)
     except Exception as e:
-        logger.error(f"Entrypoint failed: {e}")
+        logger.error("Entrypoint failed: %s", e)
         raise
 
 if __name__ == "__main__":
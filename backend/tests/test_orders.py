@@ -0,0 +1,79 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import agent
+from agent import OrderState, load_orders, save_order_to_json
+
+
+def _order(name: str) -> OrderState:
+    return OrderState(drinkType="latte", size="medium", milk="oat", extras=[], name=name)
+
+
+@pytest.fixture
+def orders_path(tmp_path, monkeypatch):
+    """Point the agent at a temporary orders.json and keep HTML output out of the repo."""
+    path = tmp_path / "orders.json"
+    monkeypatch.setattr(agent, "_ORDERS_PATH", str(path))
+    monkeypatch.setattr(agent.webbrowser, "open", lambda *args, **kwargs: True)
+    monkeypatch.chdir(tmp_path)
+    return path
+
+
+def test_load_orders_missing_file(orders_path) -> None:
+    assert load_orders() == []
+
+
+def test_save_appends_to_existing_history(orders_path) -> None:
+    orders_path.write_text(json.dumps([{"name": "Old"}]))
+
+    save_order_to_json(_order("New"))
+
+    orders = json.loads(orders_path.read_text())
+    assert [o["name"] for o in orders] == ["Old", "New"]
+    assert orders[1]["drinkType"] == "latte"
+    assert "timestamp" in orders[1]
+
+
+def test_save_creates_missing_file(orders_path) -> None:
+    save_order_to_json(_order("First"))
+
+    assert [o["name"] for o in json.loads(orders_path.read_text())] == ["First"]
+
+
+def test_save_picks_up_orders_written_by_other_processes(orders_path) -> None:
+    save_order_to_json(_order("ProcA"))
+
+    # Simulate another worker process appending after our first save
+    orders = json.loads(orders_path.read_text())
+    orders.append({"name": "ProcB"})
+    orders_path.write_text(json.dumps(orders))
+
+    save_order_to_json(_order("ProcA2"))
+
+    names = [o["name"] for o in json.loads(orders_path.read_text())]
+    assert names == ["ProcA", "ProcB", "ProcA2"]
+
+
+def test_corrupt_file_is_never_overwritten(orders_path) -> None:
+    corrupt = '[{"name":"Old"}, '
+    orders_path.write_text(corrupt)
+
+    with pytest.raises(ValueError):
+        load_orders()
+
+    save_order_to_json(_order("New"))
+    save_order_to_json(_order("Newer"))
+
+    assert orders_path.read_text() == corrupt
+
+
+def test_concurrent_saves_keep_every_order(orders_path) -> None:
+    names = [f"Guest{i}" for i in range(20)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda name: save_order_to_json(_order(name)), names))
+
+    orders = json.loads(orders_path.read_text())
+    assert sorted(o["name"] for o in orders) == sorted(names)
+    assert list(orders_path.parent.glob("*.tmp")) == []